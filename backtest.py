@@ -6,16 +6,106 @@
 import argparse
 import json
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
-import ccxt
 import pandas as pd
 import numpy as np
+from numba import njit, types
+
+from utils import MAX_FETCH_WORKERS, create_exchange, dump_json, retry
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+OHLCV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+DAY_MS = 86_400_000
+
+# Most daily bars Binance returns per klines request
+OHLCV_PAGE_LIMIT = 1000
+LISTING_SEARCH_START = datetime(2010, 1, 1)
+
+# Daily bars, crypto trades every day
+PERIODS_PER_YEAR = 365
+
+
+@njit(cache=True)
+def _buy_hold_return(close: np.ndarray) -> float:
+    """Return from buying at the first close and selling at the last"""
+    if close.shape[0] < 2:
+        return 0.0
+    
+    return (close[-1] - close[0]) / close[0]
+
+
+# Eagerly compiled for contiguous float32 closes (read-only, as pandas hands
+# them out); statistics still accumulate in float64
+_METRICS_SIGNATURE = types.UniTuple(types.f8, 4)(types.Array(types.f4, 1, 'C', readonly=True), types.i8)
+
+
+@njit(_METRICS_SIGNATURE, cache=True, fastmath=True)
+def _metrics(close: np.ndarray, ann: int) -> Tuple[float, float, float, float]:
+    """Total return, volatility, Sharpe and max drawdown in a single pass"""
+    n = close.shape[0]
+    if n < 2:
+        return 0.0, np.nan, 0.0, np.nan
+    
+    # Welford's running mean/variance of daily log returns
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    
+    # Drawdown relative to the running peak, which starts at the first return
+    peak = close[1]
+    max_drawdown = 0.0
+    
+    for i in range(1, n):
+        r = np.log(np.float64(close[i]) / close[i - 1])
+        count += 1
+        delta = r - mean
+        mean += delta / count
+        m2 += delta * (r - mean)
+        
+        if close[i] > peak:
+            peak = close[i]
+        drawdown = close[i] / peak - 1.0
+        if drawdown < max_drawdown:
+            max_drawdown = drawdown
+    
+    total_return = _buy_hold_return(close)
+    
+    if count < 2:
+        return total_return, np.nan, 0.0, max_drawdown
+    
+    volatility = np.sqrt(m2 / (count - 1)) * np.sqrt(ann)
+    sharpe = (mean * ann) / volatility if volatility > 0 else 0.0
+    
+    return total_return, volatility, sharpe, max_drawdown
+
+
+def _summary(results: Dict[str, Dict[str, float]]) -> Dict:
+    """Aggregate backtest results once for the report and the console summary"""
+    df = pd.DataFrame.from_dict(results, orient='index')
+    
+    if not results:
+        return {'avg_return': 0, 'avg_sharpe': 0, 'best': None, 'worst': None, 'df': df}
+    
+    totals = df['total_return'].to_numpy()
+    
+    # One stable argsort orders the table and gives the best performer;
+    # argmin keeps the first of tied worst performers, as min() did
+    order = np.argsort(-totals, kind='stable')
+    
+    return {
+        'avg_return': totals.mean(),
+        'avg_sharpe': df['sharpe_ratio'].to_numpy().mean(),
+        'best': df.index[order[0]],
+        'worst': df.index[np.argmin(totals)],
+        'df': df.iloc[order]
+    }
+
 
 class BuyHoldBacktester:
     """Backtesting engine for buy-hold strategy"""
@@ -25,54 +115,164 @@ class BuyHoldBacktester:
         with open(config_path, 'r') as f:
             self.config = json.load(f)
         
-        self.exchange = ccxt.binance({
-            'enableRateLimit': True,
-            'options': {'defaultType': 'spot'}
-        })
+        self.exchange = create_exchange('binance')
+        
+        # Closed daily bars never change, so keep them on disk between runs
+        self.cache_dir = '.ohlcv_cache'
+        os.makedirs(self.cache_dir, exist_ok=True)
     
-    def fetch_historical_data(self, symbol: str, days: int) -> pd.DataFrame:
-        """Fetch historical OHLCV data"""
-        try:
-            since = int((datetime.now() - timedelta(days=days)).timestamp() * 1000)
-            ohlcv = self.exchange.fetch_ohlcv(symbol, '1d', since=since, limit=days)
+    def _cache_path(self, symbol: str, suffix: str = '.parquet') -> str:
+        """Path of an on-disk cache file for a symbol"""
+        return os.path.join(self.cache_dir, f"{symbol.replace('/', '_')}{suffix}")
+    
+    @retry()
+    def _fetch_ohlcv(self, symbol: str, since: int, limit: int) -> List[list]:
+        """Fetch daily candles, retrying transient exchange errors"""
+        return self.exchange.fetch_ohlcv(symbol, '1d', since=since, limit=limit)
+    
+    def _fetch_bars_since(self, symbol: str, since: int, now_ms: int) -> List[list]:
+        """Fetch every daily bar opening from since up to now, a page at a time"""
+        bars = []
+        searched = False
+        
+        while since <= now_ms:
+            limit = min((now_ms - since) // DAY_MS + 1, OHLCV_PAGE_LIMIT)
+            page = self._fetch_ohlcv(symbol, since, limit)
             
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df.set_index('timestamp', inplace=True)
+            if not page:
+                # Binance answers a since before the listing with the first
+                # bars it has; only exchanges that don't clamp come back empty
+                if bars or searched:
+                    break
+                searched = True
+                listing_ms = self._find_listing_date(symbol)
+                if listing_ms is None or listing_ms <= since:
+                    break
+                since = listing_ms
+                continue
             
-            return df
-        except Exception as e:
-            logger.error(f"Failed to fetch data for {symbol}: {e}")
-            return pd.DataFrame()
+            bars.extend(page)
+            if len(page) < limit:
+                break
+            since = int(page[-1][0]) + DAY_MS
+        
+        return bars
     
-    def calculate_buy_hold_return(self, df: pd.DataFrame) -> float:
-        """Calculate simple buy-and-hold return"""
-        if len(df) < 2:
-            return 0.0
+    def _find_listing_date(self, symbol: str) -> Optional[int]:
+        """Binary-search the first daily bar of a symbol (ms timestamp)"""
+        path = self._cache_path(symbol, '.listing.json')
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f)['listing_ms']
         
-        start_price = df['close'].iloc[0]
-        end_price = df['close'].iloc[-1]
+        lo = int(LISTING_SEARCH_START.timestamp() * 1000)
+        hi = int(datetime.now().timestamp() * 1000)
+        listing_ms = None
         
-        return (end_price - start_price) / start_price
-    
-    def calculate_metrics(self, df: pd.DataFrame) -> Dict[str, float]:
-        """Calculate performance metrics"""
-        returns = df['close'].pct_change().dropna()
+        while hi - lo > DAY_MS:
+            mid = (lo + hi) // 2
+            bars = self._fetch_ohlcv(symbol, mid, 1)
+            
+            # A bar starting within a day of mid means the pair already traded
+            if bars and bars[0][0] < mid + DAY_MS:
+                hi = mid
+                listing_ms = bars[0][0]
+            else:
+                lo = mid
         
-        # Total return
-        total_return = self.calculate_buy_hold_return(df)
+        # No probe found a bar; search again next run rather than caching "now"
+        if listing_ms is None:
+            return None
         
-        # Volatility (annualized)
-        volatility = returns.std() * np.sqrt(365)
+        # No bar opens in [lo, hi), so the first bar at or after hi is the listing
+        with open(path, 'w') as f:
+            json.dump({'listing_ms': listing_ms}, f)
         
-        # Sharpe ratio (assuming 0% risk-free rate)
-        sharpe = (returns.mean() * 365) / volatility if volatility > 0 else 0
+        return listing_ms
+    
+    def _read_cache(self, path: str) -> np.ndarray:
+        """Load cached bars as an (n, 6) array of OHLCV rows, ms timestamps first"""
+        df = pd.read_parquet(path)
+        timestamps = df.index.astype('datetime64[ms]').asi8
         
-        # Maximum drawdown
-        cumulative = (1 + returns).cumprod()
-        running_max = cumulative.expanding().max()
-        drawdown = (cumulative - running_max) / running_max
-        max_drawdown = drawdown.min()
+        return np.column_stack([timestamps, df[OHLCV_COLUMNS[1:]].to_numpy(np.float64)])
+    
+    def _read_coverage(self, path: str) -> Optional[int]:
+        """Earliest timestamp from which the OHLCV cache has no missing bars"""
+        if not os.path.exists(path):
+            return None
+        
+        with open(path, 'r') as f:
+            return json.load(f)['covered_from_ms']
+    
+    def _write_cache(self, path: str, bars: np.ndarray) -> None:
+        """Store OHLCV rows in the parquet cache, indexed by bar open time"""
+        index = pd.to_datetime(bars[:, 0].astype(np.int64), unit='ms')
+        df = pd.DataFrame(bars[:, 1:], index=index.rename('timestamp'), columns=OHLCV_COLUMNS[1:])
+        df.to_parquet(path, compression='zstd')
+    
+    def fetch_historical_data(self, symbol: str, days: int) -> np.ndarray:
+        """Fetch historical daily closes, reusing cached bars where possible"""
+        try:
+            now = datetime.now()
+            now_ms = int(now.timestamp() * 1000)
+            since = int((now - timedelta(days=days)).timestamp() * 1000)
+            path = self._cache_path(symbol)
+            coverage_path = self._cache_path(symbol, '.coverage.json')
+            
+            # Daily bars open at UTC midnight and the exchange returns those
+            # opening at or after since, so this is the first bar we can get
+            first_bar = -(-since // DAY_MS) * DAY_MS
+            
+            cached = None
+            if os.path.exists(path):
+                cached = self._read_cache(path)
+                covered_from = self._read_coverage(coverage_path)
+                if covered_from is None and len(cached):
+                    covered_from = cached[0, 0]
+                
+                if len(cached) and covered_from <= first_bar:
+                    # Only request the tail; the last cached bar is refetched
+                    # because it may not have been closed when it was stored
+                    since = int(cached[-1, 0])
+                else:
+                    cached = None
+            
+            ohlcv = self._fetch_bars_since(symbol, since, now_ms)
+            bars = np.asarray(ohlcv, dtype=np.float64).reshape(-1, len(OHLCV_COLUMNS))
+            
+            if cached is not None:
+                # Keep the most recent copy of each bar, ordered by timestamp
+                bars = np.concatenate([cached, bars])[::-1]
+                _, first = np.unique(bars[:, 0], return_index=True)
+                bars = bars[first]
+            
+            if len(bars):
+                self._write_cache(path, bars)
+                if cached is None:
+                    # A full fetch returned every bar from first_bar on, even
+                    # when the pair only started trading later in the window
+                    with open(coverage_path, 'w') as f:
+                        json.dump({'covered_from_ms': first_bar}, f)
+            
+            # Six significant digits are plenty for daily closes and halve
+            # the memory the metrics kernel has to stream
+            return np.ascontiguousarray(bars[-days:, 4], dtype=np.float32)
+        except Exception as e:
+            logger.error("Failed to fetch data for %s: %s", symbol, e)
+            return np.empty(0, dtype=np.float32)
+    
+    def calculate_buy_hold_return(self, close: np.ndarray) -> float:
+        """Calculate simple buy-and-hold return"""
+        return _buy_hold_return(close)
+    
+    def calculate_metrics(self, close: np.ndarray) -> Dict[str, float]:
+        """Calculate performance metrics from daily closes"""
+        close = np.ascontiguousarray(close, dtype=np.float32)
+        
+        # Annualized volatility and Sharpe (0% risk-free rate) of daily log returns,
+        # plus max drawdown, fused into one pass over the close prices
+        total_return, volatility, sharpe, max_drawdown = _metrics(close, PERIODS_PER_YEAR)
         
         return {
             'total_return': total_return,
@@ -83,29 +283,41 @@ class BuyHoldBacktester:
     
     def run_backtest(self, pairs: List[str], days: int) -> Dict[str, Dict[str, float]]:
         """Run backtest on multiple pairs"""
-        results = {}
+        metrics_by_pair = {}
         
-        for pair in pairs:
-            logger.info(f"Backtesting {pair}...")
-            
-            # Fetch data
-            df = self.fetch_historical_data(pair, days)
+        # Load markets once up front; ccxt's load_markets has no lock, so every
+        # worker would otherwise download exchangeInfo itself
+        self.exchange.load_markets()
+        
+        # Fetch all pairs concurrently and score each one as soon as its data
+        # lands, so computing metrics overlaps with the fetches still in flight
+        with ThreadPoolExecutor(max_workers=max(1, min(len(pairs), MAX_FETCH_WORKERS))) as executor:
+            futures = {}
+            for pair in pairs:
+                logger.info("Backtesting %s...", pair)
+                futures[executor.submit(self.fetch_historical_data, pair, days)] = pair
             
-            if not df.empty:
-                # Calculate metrics
-                metrics = self.calculate_metrics(df)
-                results[pair] = metrics
+            for future in as_completed(futures):
+                pair = futures[future]
+                close = future.result()
                 
-                logger.info(f"{pair}: {metrics['total_return']:.2%} return, "
-                          f"{metrics['sharpe_ratio']:.2f} Sharpe")
-            else:
-                logger.warning(f"No data for {pair}")
+                if close.size:
+                    # Calculate metrics
+                    metrics = self.calculate_metrics(close)
+                    metrics_by_pair[pair] = metrics
+                    
+                    logger.info("%s: %.2f%% return, %.2f Sharpe",
+                                pair, metrics['total_return'] * 100, metrics['sharpe_ratio'])
+                else:
+                    logger.warning("No data for %s", pair)
         
-        return results
+        # Report pairs in the order they were requested
+        return {pair: metrics_by_pair[pair] for pair in pairs if pair in metrics_by_pair}
     
-    def generate_report(self, results: Dict[str, Dict[str, float]], days: int) -> str:
+    def generate_report(self, results: Dict[str, Dict[str, float]], days: int,
+                        summary: Optional[Dict] = None) -> str:
         """Generate backtest report"""
-        report = f"""# 📊 Buy-Hold Backtest Report
+        parts = [f"""# 📊 Buy-Hold Backtest Report
 
 ## Test Parameters
 - **Period**: {days} days
@@ -116,66 +328,64 @@ class BuyHoldBacktester:
 
 | Pair | Return | Volatility | Sharpe | Max Drawdown |
 |------|--------|------------|--------|--------------|
-"""
+"""]
         
-        total_return = 0
-        for pair, metrics in sorted(results.items(), key=lambda x: x[1]['total_return'], reverse=True):
-            report += f"| {pair} | {metrics['total_return']:.2%} | "
-            report += f"{metrics['volatility']:.2%} | {metrics['sharpe_ratio']:.2f} | "
-            report += f"{metrics['max_drawdown']:.2%} |\n"
-            total_return += metrics['total_return']
+        if summary is None:
+            summary = _summary(results)
+        avg_return = summary['avg_return']
         
-        avg_return = total_return / len(results) if results else 0
+        parts.extend(
+            f"| {r.Index} | {r.total_return:.2%} | {r.volatility:.2%} | "
+            f"{r.sharpe_ratio:.2f} | {r.max_drawdown:.2%} |\n"
+            for r in summary['df'].itertuples()
+        )
         
-        report += f"\n**Average Return**: {avg_return:.2%}\n"
+        parts.append(f"\n**Average Return**: {avg_return:.2%}\n")
         
         # Add insights
-        report += "\n## Key Insights\n\n"
+        parts.append("\n## Key Insights\n\n")
         
         # Best performer
         if results:
-            best_pair = max(results.items(), key=lambda x: x[1]['total_return'])
-            worst_pair = min(results.items(), key=lambda x: x[1]['total_return'])
-            
-            report += f"- **Best Performer**: {best_pair[0]} ({best_pair[1]['total_return']:.2%})\n"
-            report += f"- **Worst Performer**: {worst_pair[0]} ({worst_pair[1]['total_return']:.2%})\n"
+            best_pair, worst_pair = summary['best'], summary['worst']
+            parts.append(f"- **Best Performer**: {best_pair} ({results[best_pair]['total_return']:.2%})\n")
+            parts.append(f"- **Worst Performer**: {worst_pair} ({results[worst_pair]['total_return']:.2%})\n")
             
             # Risk analysis
-            avg_sharpe = sum(m['sharpe_ratio'] for m in results.values()) / len(results)
-            report += f"- **Average Sharpe Ratio**: {avg_sharpe:.2f}\n"
+            parts.append(f"- **Average Sharpe Ratio**: {summary['avg_sharpe']:.2f}\n")
             
             # Market condition
             if avg_return > 0.1:
-                report += "- **Market Condition**: Strong Bull Market\n"
+                parts.append("- **Market Condition**: Strong Bull Market\n")
             elif avg_return > 0:
-                report += "- **Market Condition**: Mild Bull Market\n"
+                parts.append("- **Market Condition**: Mild Bull Market\n")
             else:
-                report += "- **Market Condition**: Bear Market\n"
+                parts.append("- **Market Condition**: Bear Market\n")
         
-        return report
+        return ''.join(parts)
     
-    def save_results(self, results: Dict[str, Dict[str, float]], days: int):
+    def save_results(self, results: Dict[str, Dict[str, float]], days: int,
+                     summary: Optional[Dict] = None):
         """Save backtest results"""
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         # Save raw results
         results_file = f'backtest_results_{timestamp}.json'
-        with open(results_file, 'w') as f:
-            json.dump({
-                'timestamp': timestamp,
-                'days': days,
-                'results': results
-            }, f, indent=2)
+        dump_json({
+            'timestamp': timestamp,
+            'days': days,
+            'results': results
+        }, results_file)
         
-        logger.info(f"💾 Results saved to {results_file}")
+        logger.info("💾 Results saved to %s", results_file)
         
         # Save report
-        report = self.generate_report(results, days)
+        report = self.generate_report(results, days, summary)
         report_file = f'backtest_report_{timestamp}.md'
         with open(report_file, 'w') as f:
             f.write(report)
         
-        logger.info(f"📄 Report saved to {report_file}")
+        logger.info("📄 Report saved to %s", report_file)
 
 
 def main():
@@ -194,17 +404,17 @@ def main():
     # Run backtest
     backtester = BuyHoldBacktester(args.config)
     results = backtester.run_backtest(pairs, args.days)
+    summary = _summary(results)
     
     # Save results
-    backtester.save_results(results, args.days)
+    backtester.save_results(results, args.days, summary)
     
     # Print summary
     print("\n🏆 Backtest Complete!")
     print(f"Tested {len(results)} pairs over {args.days} days")
     
     if results:
-        avg_return = sum(m['total_return'] for m in results.values()) / len(results)
-        print(f"Average Return: {avg_return:.2%}")
+        print(f"Average Return: {summary['avg_return']:.2%}")
 
 
 if __name__ == "__main__":
@@ -6,15 +6,19 @@ The simplest strategy that beats complex algorithms
 
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
-import ccxt
 import pandas as pd
 
+from utils import MAX_FETCH_WORKERS, create_exchange, dump_json, retry
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+POSITION_COLUMNS = ['amount', 'entry_price', 'entry_time', 'size_usd']
+
 
 class SmartBuyHoldStrategy:
     """Smart buy-and-hold strategy with pair selection"""
@@ -25,57 +29,74 @@ class SmartBuyHoldStrategy:
             self.config = json.load(f)
         
         self.exchange = None
-        self.positions: Dict[str, Dict[str, float]] = {}
+        # One row per pair, indexed by symbol
+        self.positions = pd.DataFrame(columns=POSITION_COLUMNS)
         self.performance: Dict[str, float] = {}
         
     def connect_exchange(self) -> None:
         """Connect to exchange"""
         exchange_config = self.config['exchange']
         
-        self.exchange = getattr(ccxt, exchange_config['name'])({
-            'apiKey': exchange_config.get('api_key'),
-            'secret': exchange_config.get('api_secret'),
-            'enableRateLimit': True,
-            'options': {'defaultType': 'spot'}
-        })
+        self.exchange = create_exchange(
+            exchange_config['name'],
+            exchange_config.get('api_key'),
+            exchange_config.get('api_secret')
+        )
         
-        logger.info(f"✅ Connected to {exchange_config['name']}")
+        # Load markets once up front; ccxt's load_markets has no lock, so every
+        # fetch_momentum worker would otherwise download exchangeInfo itself
+        self.exchange.load_markets()
         
-    def select_pairs(self) -> List[str]:
-        """Select best performing pairs based on momentum"""
+        logger.info("✅ Connected to %s", exchange_config['name'])
+        
+    @retry()
+    def _fetch_ohlcv(self, pair: str, limit: int) -> List[list]:
+        """Fetch daily candles, retrying transient exchange errors"""
+        return self.exchange.fetch_ohlcv(pair, '1d', limit=limit)
+    
+    @retry()
+    def _fetch_tickers(self, pairs: List[str]) -> Dict[str, dict]:
+        """Fetch tickers for several pairs, retrying transient exchange errors"""
+        return self.exchange.fetch_tickers(pairs)
+    
+    def _pair_momentum(self, pair: str) -> float:
+        """30-day return of a pair, 0 if it cannot be fetched"""
+        if not self.exchange:
+            return 0
+        
+        try:
+            ohlcv = self._fetch_ohlcv(pair, 30)
+            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+            
+            return (df['close'].iloc[-1] - df['close'].iloc[0]) / df['close'].iloc[0]
+        except Exception as e:
+            logger.warning("Failed to get data for %s: %s", pair, e)
+            return 0
+    
+    def fetch_momentum(self, pairs: List[str]) -> Dict[str, float]:
+        """Fetch 30-day momentum for all pairs concurrently"""
+        with ThreadPoolExecutor(max_workers=max(1, min(len(pairs), MAX_FETCH_WORKERS))) as executor:
+            return dict(zip(pairs, executor.map(self._pair_momentum, pairs)))
+    
+    def select_pairs(self) -> Tuple[List[str], Dict[str, float]]:
+        """Select best performing pairs, returning them with their momentum"""
         pairs = self.config['pairs']
         
         if self.config.get('dynamic_selection', False):
             # Rank pairs by recent performance
-            performance_data = {}
-            
-            for pair in pairs:
-                try:
-                    # Get 30-day performance
-                    if self.exchange:
-                        ohlcv = self.exchange.fetch_ohlcv(pair, '1d', limit=30)
-                        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-                        
-                        # Calculate momentum
-                        returns = (df['close'].iloc[-1] - df['close'].iloc[0]) / df['close'].iloc[0]
-                        performance_data[pair] = returns
-                    else:
-                        performance_data[pair] = 0
-                    
-                except Exception as e:
-                    logger.warning(f"Failed to get data for {pair}: {e}")
-                    performance_data[pair] = 0
+            performance_data = self.fetch_momentum(pairs)
             
             # Sort by performance and select top N
             sorted_pairs = sorted(performance_data.items(), key=lambda x: x[1], reverse=True)
             selected = [pair for pair, _ in sorted_pairs[:self.config.get('max_pairs', 5)]]
             
-            logger.info(f"📊 Selected pairs: {selected}")
-            return selected
+            logger.info("📊 Selected pairs: %s", selected)
+            return selected, performance_data
         
-        return pairs
+        return pairs, {}
     
-    def calculate_position_sizes(self, pairs: List[str]) -> Dict[str, float]:
+    def calculate_position_sizes(self, pairs: List[str],
+                                 momentum: Optional[Dict[str, float]] = None) -> Dict[str, float]:
         """Calculate position size for each pair"""
         total_capital = self.config['capital']
         allocation = self.config.get('allocation', 'equal')
@@ -86,20 +107,14 @@ class SmartBuyHoldStrategy:
             return {pair: size_per_pair for pair in pairs}
         
         elif allocation == 'momentum':
-            # Allocate more to better performers
-            performance_data = {}
+            # Allocate more to better performers, reusing momentum already fetched
+            momentum = dict(momentum or {})
+            missing = [pair for pair in pairs if pair not in momentum]
+            if missing:
+                momentum.update(self.fetch_momentum(missing))
             
-            for pair in pairs:
-                try:
-                    if self.exchange:
-                        ohlcv = self.exchange.fetch_ohlcv(pair, '1d', limit=30)
-                        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-                        returns = (df['close'].iloc[-1] - df['close'].iloc[0]) / df['close'].iloc[0]
-                        performance_data[pair] = max(0, returns)  # Only positive returns
-                    else:
-                        performance_data[pair] = 0
-                except Exception:
-                    performance_data[pair] = 0
+            # Only positive returns
+            performance_data = {pair: max(0, momentum[pair]) for pair in pairs}
             
             # Normalize weights
             total_weight = sum(performance_data.values())
@@ -114,14 +129,20 @@ class SmartBuyHoldStrategy:
     
     def execute_trades(self):
         """Execute buy orders for selected pairs"""
-        pairs = self.select_pairs()
-        position_sizes = self.calculate_position_sizes(pairs)
+        pairs, momentum = self.select_pairs()
+        position_sizes = self.calculate_position_sizes(pairs, momentum=momentum)
         
+        # Get current prices for all pairs in one request
+        try:
+            tickers = self._fetch_tickers(list(position_sizes.keys()))
+        except Exception as e:
+            logger.error("❌ Failed to fetch prices: %s", e)
+            return
+        
+        entries = {}
         for pair, size in position_sizes.items():
             try:
-                # Get current price
-                ticker = self.exchange.fetch_ticker(pair)
-                price = ticker['last']
+                price = tickers[pair]['last']
                 
                 # Calculate amount
                 amount = size / price
@@ -129,12 +150,12 @@ class SmartBuyHoldStrategy:
                 # Place market buy order
                 if self.config.get('live_trading', False):
                     _ = self.exchange.create_market_buy_order(pair, amount)
-                    logger.info(f"✅ Bought {amount:.4f} {pair} at {price:.2f}")
+                    logger.info("✅ Bought %.4f %s at %.2f", amount, pair, price)
                 else:
-                    logger.info(f"📝 [PAPER] Would buy {amount:.4f} {pair} at {price:.2f}")
+                    logger.info("📝 [PAPER] Would buy %.4f %s at %.2f", amount, pair, price)
                 
                 # Record position
-                self.positions[pair] = {
+                entries[pair] = {
                     'amount': amount,
                     'entry_price': price,
                     'entry_time': datetime.now().isoformat(),
@@ -142,38 +163,56 @@ class SmartBuyHoldStrategy:
                 }
                 
             except Exception as e:
-                logger.error(f"❌ Failed to buy {pair}: {e}")
+                logger.error("❌ Failed to buy %s: %s", pair, e)
+        
+        if entries:
+            new_positions = pd.DataFrame.from_dict(entries, orient='index', columns=POSITION_COLUMNS)
+            kept = self.positions.drop(index=new_positions.index, errors='ignore')
+            self.positions = new_positions if kept.empty else pd.concat([kept, new_positions])
     
     def check_performance(self):
         """Check current performance of positions"""
-        total_value = 0
-        total_cost = 0
+        if self.positions.empty:
+            return
         
-        for pair, position in self.positions.items():
-            try:
-                ticker = self.exchange.fetch_ticker(pair)
-                current_price = ticker['last']
-                
-                current_value = position['amount'] * current_price
-                cost = position['size_usd']
-                
-                profit = current_value - cost
-                profit_pct = (profit / cost) * 100
-                
-                total_value += current_value
-                total_cost += cost
-                
-                logger.info(f"{pair}: ${current_value:.2f} ({profit_pct:+.2f}%)")
-                
-            except Exception as e:
-                logger.error(f"Failed to check {pair}: {e}")
+        try:
+            tickers = self._fetch_tickers(list(self.positions.index))
+        except Exception as e:
+            logger.error("Failed to fetch prices: %s", e)
+            return
+        
+        prices = pd.Series({pair: ticker.get('last') for pair, ticker in tickers.items()}, dtype=float)
+        positions = self.positions.assign(price=prices.reindex(self.positions.index))
+        
+        for pair in positions.index[positions['price'].isna()]:
+            logger.error("Failed to check %s: no price available", pair)
+        positions = positions.dropna(subset=['price'])
+        
+        # A zero-cost position has no meaningful P&L percentage
+        zero_cost = positions['size_usd'] == 0
+        for pair in positions.index[zero_cost]:
+            logger.error("Failed to check %s: position has zero cost", pair)
+        positions = positions[~zero_cost]
+        
+        # Value every position at once
+        current_value = positions['amount'] * positions['price']
+        cost = positions['size_usd']
+        profit_pct = (current_value - cost) / cost * 100
+        
+        # Skip the per-position loop entirely when INFO is filtered out
+        if logger.isEnabledFor(logging.INFO):
+            for pair, value, pct in zip(positions.index, current_value, profit_pct):
+                logger.info("%s: $%.2f (%+.2f%%)", pair, value, pct)
+        
+        total_value = current_value.sum()
+        total_cost = cost.sum()
         
         if total_cost > 0:
             total_profit = total_value - total_cost
             total_profit_pct = (total_profit / total_cost) * 100
             
-            logger.info(f"\n📊 Total Portfolio: ${total_value:.2f} ({total_profit_pct:+.2f}%)")
-            logger.info(f"💰 Total Profit: ${total_profit:.2f}")
+            logger.info("\n📊 Total Portfolio: $%.2f (%+.2f%%)", total_value, total_profit_pct)
+            logger.info("💰 Total Profit: $%.2f", total_profit)
     
     def rebalance(self):
         """Rebalance portfolio if configured"""
@@ -186,7 +225,7 @@ class SmartBuyHoldStrategy:
         logger.info("🔄 Rebalancing portfolio...")
         
         # Sell current positions
-        for pair in list(self.positions.keys()):
+        for pair in list(self.positions.index):
             # Sell logic here
             pass
         
@@ -212,12 +251,11 @@ class SmartBuyHoldStrategy:
     def save_state(self):
         """Save current positions to file"""
         state = {
-            'positions': self.positions,
+            'positions': self.positions.to_dict(orient='index'),
             'timestamp': datetime.now().isoformat()
         }
         
-        with open('positions.json', 'w') as f:
-            json.dump(state, f, indent=2)
+        dump_json(state, 'positions.json')
         
         logger.info("💾 Saved positions to positions.json")
 
@@ -0,0 +1,83 @@
+"""
+🧪 Tests for the backtester's OHLCV cache
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backtest import DAY_MS, BuyHoldBacktester  # noqa: E402
+
+
+class FakeExchange:
+    """Serves daily bars from listed_days ago up to today, recording calls"""
+    
+    def __init__(self, listed_days: int):
+        today = int(time.time() * 1000) // DAY_MS * DAY_MS
+        self.bars = [[today - i * DAY_MS, 1.0, 1.0, 1.0, 100.0 + i, 1.0]
+                     for i in range(listed_days, -1, -1)]
+        self.calls = []
+    
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.calls.append((since, limit))
+        return [list(bar) for bar in self.bars if bar[0] >= since][:limit]
+
+
+@pytest.fixture
+def backtester(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = tmp_path / 'config.json'
+    config.write_text(json.dumps({}))
+    
+    return BuyHoldBacktester(str(config))
+
+
+@pytest.mark.parametrize('listed_days,days', [
+    (400, 30),    # window fully inside the pair's history
+    (10, 30),     # pair listed inside the window
+    (100, 500),   # window clamped to the listing date
+])
+def test_same_day_rerun_only_fetches_tail(backtester, listed_days, days):
+    backtester.exchange = FakeExchange(listed_days)
+    
+    first = backtester.fetch_historical_data('X/USDT', days)
+    calls_before = len(backtester.exchange.calls)
+    second = backtester.fetch_historical_data('X/USDT', days)
+    
+    # Only today's (possibly still open) bar is requested again
+    assert backtester.exchange.calls[calls_before:] == [(backtester.exchange.bars[-1][0], 1)]
+    assert (first == second).all()
+
+
+class NonClampingExchange(FakeExchange):
+    """Only serves bars inside [since, since + limit days), like a plain range query"""
+    
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        if self.bars[0][0] >= since + limit * DAY_MS:
+            self.calls.append((since, limit))
+            return []
+        return super().fetch_ohlcv(symbol, timeframe, since, limit)
+
+
+def test_long_window_is_paginated(backtester):
+    backtester.exchange = FakeExchange(1500)
+    
+    close = backtester.fetch_historical_data('X/USDT', 1200)
+    
+    assert len(close) == 1200
+    assert close[-1] == backtester.exchange.bars[-1][4]
+    assert len(backtester.exchange.calls) == 2
+
+
+def test_window_before_listing_on_non_clamping_exchange(backtester):
+    backtester.exchange = NonClampingExchange(100)
+    
+    close = backtester.fetch_historical_data('X/USDT', 500)
+    
+    assert len(close) == 101
+    assert close[0] == backtester.exchange.bars[0][4]
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+🔧 Shared helpers for the strategy and the backtester
+"""
+
+import functools
+import json
+import logging
+import threading
+import time
+from typing import Callable, Tuple, Type
+
+import ccxt
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Transient failures worth another attempt; NetworkError covers 5xx/DDoS responses
+RETRYABLE_ERRORS = (ccxt.NetworkError, ccxt.RequestTimeout, ccxt.RateLimitExceeded)
+
+# Upper bound on concurrent HTTP requests when fetching pairs
+MAX_FETCH_WORKERS = 16
+
+# Enough keep-alive connections for the concurrent fetch workers
+HTTP_POOL_SIZE = 32
+
+
+@functools.lru_cache(maxsize=None)
+def create_exchange(name: str = 'binance', api_key: str = None, api_secret: str = None) -> ccxt.Exchange:
+    """Create an exchange client, reusing it for identical settings"""
+    exchange = getattr(ccxt, name)({
+        'apiKey': api_key,
+        'secret': api_secret,
+        'enableRateLimit': True,
+        'options': {'defaultType': 'spot'}
+    })
+    
+    # Pool connections on the client's session so TLS setup happens once per host
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    exchange.session.mount('https://', adapter)
+    
+    # ccxt's sync throttle reads lastRestRequestTimestamp without a lock, so
+    # concurrent fetch threads would all wait the same delay and fire together.
+    # Serialize it and reserve the slot before releasing the next caller.
+    throttle = exchange.throttle
+    throttle_lock = threading.Lock()
+    
+    def locked_throttle(cost=None):
+        with throttle_lock:
+            throttle(cost)
+            exchange.lastRestRequestTimestamp = exchange.milliseconds()
+    
+    exchange.throttle = locked_throttle
+    
+    return exchange
+
+
+def retry(on: Tuple[Type[Exception], ...] = RETRYABLE_ERRORS, tries: int = 3, base: float = 0.25):
+    """Retry a call on transient errors with exponential backoff"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(tries - 1):
+                try:
+                    return func(*args, **kwargs)
+                except on as e:
+                    delay = base * 2 ** attempt
+                    logger.warning("%s failed (%s), retrying in %.2fs", func.__name__, e, delay)
+                    time.sleep(delay)
+            
+            # Last attempt lets the error propagate
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def dump_json(obj, path: str) -> None:
+    """Write obj to path as indented JSON, using orjson when available"""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(path, 'w') as f:
+            json.dump(obj, f, indent=2)